@@ -1,66 +1,160 @@
-from fastapi import FastAPI, Request, HTTPException, Query
-from pydantic import BaseModel
+from fastapi import FastAPI, Request, Response, HTTPException, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel, ValidationError
 from typing import Optional, List
 import os
-import requests
+import base64
+import json
+import httpx
+import orjson
 import logging
+import asyncio
+import random
 import time
+import uuid
+from collections import OrderedDict
 from functools import wraps
 from datetime import datetime, timedelta
 
 # Configuration du logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="Odoo-TopTex Proxy", version="1.0.0")
+app = FastAPI(title="Odoo-TopTex Proxy", version="1.0.0", default_response_class=ORJSONResponse)
 
 TOPTEX_API_KEY = os.getenv("TOPTEX_API_KEY")
 TOPTEX_BASE_URL = os.getenv("TOPTEX_BASE_URL", "https://api.toptex.io/v3")
 WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
 
+# =============================================================================
+# Client HTTP partagé
+# =============================================================================
+
+def get_http_client() -> httpx.AsyncClient:
+    """Retourne le client HTTP partagé vers TopTex (créé au démarrage)"""
+    client = getattr(app.state, "http", None)
+    if client is None:
+        # Fallback si un appel arrive avant l'événement startup (tests, etc.)
+        client = create_http_client()
+        app.state.http = client
+    return client
+
+# Dimensionnement du pool de connexions TopTex, surchargeable par l'environnement
+# pour coller au nombre de workers déployés et aux limites TopTex
+_CPU_COUNT = os.cpu_count() or 1
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 8 * _CPU_COUNT))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 2 * _CPU_COUNT))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 120))
+
+def create_http_client() -> httpx.AsyncClient:
+    """Crée le client HTTP asynchrone réutilisé pour tous les appels TopTex"""
+    return httpx.AsyncClient(
+        base_url=TOPTEX_BASE_URL,
+        # pool=2.0 : un pool saturé échoue vite au lieu de faire patienter la requête
+        timeout=httpx.Timeout(connect=5.0, read=30.0, write=10.0, pool=2.0),
+        http2=True,
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def pool_stats() -> dict:
+    """Statistiques du pool de connexions httpx (meilleur effort, API privée)"""
+    stats = {
+        "max_connections": HTTP_MAX_CONNECTIONS,
+        "max_keepalive": HTTP_MAX_KEEPALIVE,
+    }
+    try:
+        connections = get_http_client()._transport._pool.connections
+        stats["connections"] = len(connections)
+        stats["idle"] = sum(1 for conn in connections if conn.is_idle())
+    except Exception:
+        pass
+    return stats
+
 # =============================================================================
 # Gestion de l'authentification TopTex
 # =============================================================================
 
+# Durée de vie par défaut si TopTex n'indique pas d'expiration
+DEFAULT_TOKEN_TTL = timedelta(hours=24)
+# Marge de sécurité pour rafraîchir avant l'expiration réelle
+TOKEN_TTL_SAFETY_MARGIN = timedelta(seconds=60)
+
 class AuthenticationManager:
     """Gestionnaire d'authentification avec cache du token"""
     def __init__(self):
         self.token = None
         self.token_expiry = None
-    
+        self._headers = None
+        self._lock = asyncio.Lock()
+
     def is_token_valid(self) -> bool:
         """Vérifie si le token est valide et non expiré"""
         if self.token is None or self.token_expiry is None:
             return False
         return datetime.now() < self.token_expiry
-    
-    def authenticate(self) -> str:
+
+    async def authenticate(self) -> str:
         """S'authentifie auprès de TopTex et retourne le token"""
         try:
             logger.info("🔐 Authentification auprès de TopTex...")
-            response = requests.post(
-                f"{TOPTEX_BASE_URL}/authenticate",
+            response = await get_http_client().post(
+                "/authenticate",
                 json={"api_key": TOPTEX_API_KEY},
-                timeout=30
             )
             response.raise_for_status()
-            data = response.json()
-            
+            data = orjson.loads(response.content)
+
             self.token = data.get("token")
-            # Assume le token expire dans 24h (à adapter selon la doc TopTex)
-            self.token_expiry = datetime.now() + timedelta(hours=24)
-            
-            logger.info(f"✓ Authentification réussie. Token valide jusqu'à {self.token_expiry}")
+            # Headers pré-construits : reconstruits uniquement à la rotation du token
+            self._headers = {
+                "Authorization": f"Bearer {self.token}",
+                "Content-Type": "application/json",
+            }
+            ttl = self._token_ttl(data)
+            self.token_expiry = datetime.now() + max(ttl - TOKEN_TTL_SAFETY_MARGIN, timedelta(0))
+
+            logger.info("✓ Authentification réussie. Token valide jusqu'à %s", self.token_expiry)
             return self.token
-        except requests.exceptions.RequestException as e:
-            logger.error(f"✗ Erreur d'authentification: {str(e)}")
+        except httpx.HTTPError as e:
+            logger.error("✗ Erreur d'authentification: %s", e)
             raise HTTPException(status_code=503, detail=f"Authentication failed: {str(e)}")
-    
-    def get_token(self) -> str:
-        """Retourne un token valide, en authentifiant si nécessaire"""
-        if not self.is_token_valid():
-            return self.authenticate()
-        return self.token
+
+    def _token_ttl(self, data: dict) -> timedelta:
+        """Détermine la durée de vie du token depuis la réponse d'authentification.
+
+        Lit `expires_in` (secondes) si présent, sinon tente le claim `exp`
+        du JWT, et retombe sur 24h en dernier recours.
+        """
+        expires_in = data.get("expires_in")
+        if expires_in:
+            return timedelta(seconds=int(expires_in))
+        try:
+            payload = self.token.split(".")[1]
+            claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+            exp = claims.get("exp")
+            if exp:
+                return datetime.fromtimestamp(exp) - datetime.now()
+        except Exception:
+            pass
+        return DEFAULT_TOKEN_TTL
+
+    async def get_token(self) -> str:
+        """Retourne un token valide, en authentifiant si nécessaire.
+
+        Le verrou garantit qu'un seul appel rafraîchit le token à l'expiration,
+        les appels concurrents attendent puis réutilisent le résultat.
+        """
+        if self.is_token_valid():
+            return self.token
+        async with self._lock:
+            # Double vérification : un autre appel a pu rafraîchir pendant l'attente
+            if self.is_token_valid():
+                return self.token
+            return await self.authenticate()
 
 # Instance globale du gestionnaire d'authentification
 auth_manager = AuthenticationManager()
@@ -100,30 +194,317 @@ class UpdateOrder(BaseModel):
 # Utilitaires et Middleware
 # =============================================================================
 
-def retry_with_backoff(max_retries=3, backoff_factor=1):
-    """Décorateur pour réessayer les requêtes avec backoff exponentiel"""
+class RateLimited(Exception):
+    """Levée quand TopTex répond 429; porte le délai Retry-After à respecter"""
+    def __init__(self, retry_after: float):
+        super().__init__(f"rate limited by upstream, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+def is_retryable_error(exc: httpx.HTTPError) -> bool:
+    """Indique si une erreur TopTex mérite une nouvelle tentative (5xx, 408, timeout, connexion).
+
+    Les autres erreurs 4xx (authentification, validation) ne doivent jamais être rejouées.
+    """
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status >= 500 or status == 408
+    return isinstance(exc, httpx.TransportError)
+
+class CircuitBreaker:
+    """Disjoncteur CLOSED -> OPEN -> HALF_OPEN autour d'un upstream.
+
+    Après `fail_threshold` échecs consécutifs, le circuit s'ouvre et les
+    appels échouent immédiatement en 503 sans solliciter l'upstream.
+    Après `reset_timeout` secondes, un appel de test est laissé passer
+    (HALF_OPEN) : s'il réussit le circuit se referme, sinon il se rouvre.
+    """
+    def __init__(self, fail_threshold=5, reset_timeout=30):
+        self.fail_threshold = fail_threshold
+        self.reset_timeout = reset_timeout
+        self.fail_count = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        """Retourne l'état courant: closed, open ou half_open"""
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        """Fast-fail si le circuit est ouvert"""
+        if self.state == "open":
+            raise HTTPException(status_code=503, detail="upstream circuit open")
+
+    def record_success(self):
+        """Referme le circuit après un appel réussi"""
+        if self.opened_at is not None:
+            logger.info("✓ Circuit TopTex refermé")
+        self.fail_count = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        """Compte l'échec et ouvre (ou rouvre) le circuit si nécessaire"""
+        self.fail_count += 1
+        if self.fail_count >= self.fail_threshold or self.opened_at is not None:
+            self.opened_at = time.monotonic()
+            logger.warning("⚠ Circuit TopTex ouvert après %s échecs consécutifs", self.fail_count)
+
+# Un disjoncteur par upstream (un seul ici: l'API TopTex)
+toptex_breaker = CircuitBreaker()
+
+class TokenBucket:
+    """Limiteur de débit (token bucket) pour lisser le trafic sortant.
+
+    Chaque appel consomme un jeton; le seau se remplit à `rate` jetons/s
+    jusqu'à `capacity`. Une rafale au-delà de la capacité attend son tour
+    au lieu de pousser TopTex à nous bloquer en 429.
+    """
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    @property
+    def level(self) -> float:
+        """Nombre de jetons actuellement disponibles"""
+        self._refill()
+        return self.tokens
+
+    async def acquire(self):
+        """Consomme un jeton, en attendant le remplissage si le seau est vide"""
+        async with self._lock:
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+# Cloison (bulkhead) : borne les appels TopTex simultanés pour qu'un upstream
+# lent fasse patienter les rafales au lieu de saturer tous les workers
+TOPTEX_MAX_CONCURRENCY = 50
+TOPTEX_MAX_QUEUE = 100
+toptex_sema = asyncio.Semaphore(TOPTEX_MAX_CONCURRENCY)
+
+# Débit sortant maximal vers TopTex, à caler sous le quota du compte
+TOPTEX_RATE_LIMIT = float(os.getenv("TOPTEX_RATE_LIMIT", 50))
+toptex_bucket = TokenBucket(rate=TOPTEX_RATE_LIMIT)
+toptex_queue_depth = 0  # appels en attente d'un slot de la cloison
+
+async def call_toptex(method: str, path: str, **kwargs) -> httpx.Response:
+    """Appelle l'API TopTex via le client partagé, sous contrôle du disjoncteur et de la cloison"""
+    global toptex_queue_depth
+    toptex_breaker.before_call()
+    if toptex_sema.locked() and toptex_queue_depth >= TOPTEX_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="upstream bulkhead saturated")
+    toptex_queue_depth += 1
+    try:
+        await toptex_sema.acquire()
+    finally:
+        toptex_queue_depth -= 1
+    try:
+        await toptex_bucket.acquire()
+        headers = await get_toptex_headers()
+        extra_headers = kwargs.pop("headers", None)
+        if extra_headers:
+            headers = {**headers, **extra_headers}
+        try:
+            response = await get_http_client().request(method, path, headers=headers, **kwargs)
+            if response.status_code == 429:
+                try:
+                    retry_after = float(response.headers.get("Retry-After", "1"))
+                except ValueError:
+                    retry_after = 1.0
+                raise RateLimited(retry_after)
+            # 304 = revalidation If-None-Match réussie, pas une erreur
+            # (raise_for_status d'httpx lève sur tout statut non-2xx)
+            if response.status_code != 304:
+                response.raise_for_status()
+        except httpx.HTTPError as e:
+            if is_retryable_error(e):
+                toptex_breaker.record_failure()
+            raise
+        toptex_breaker.record_success()
+        return response
+    finally:
+        toptex_sema.release()
+
+# Au-delà de cette taille de page, la réponse est relayée en streaming
+# sans décodage (évite le pic mémoire + CPU d'un decode/encode complet)
+STREAM_PAGE_THRESHOLD = 100
+
+async def stream_toptex(method: str, path: str, **kwargs) -> StreamingResponse:
+    """Relaie une réponse TopTex en streaming, sans la matérialiser en mémoire.
+
+    Même protection que call_toptex (disjoncteur + cloison); la cloison
+    reste occupée jusqu'à la fin du transfert vers le client.
+    """
+    global toptex_queue_depth
+    toptex_breaker.before_call()
+    if toptex_sema.locked() and toptex_queue_depth >= TOPTEX_MAX_QUEUE:
+        raise HTTPException(status_code=503, detail="upstream bulkhead saturated")
+    toptex_queue_depth += 1
+    try:
+        await toptex_sema.acquire()
+    finally:
+        toptex_queue_depth -= 1
+    try:
+        await toptex_bucket.acquire()
+        headers = await get_toptex_headers()
+        request = get_http_client().build_request(method, path, headers=headers, **kwargs)
+        response = await get_http_client().send(request, stream=True)
+    except httpx.HTTPError as e:
+        toptex_sema.release()
+        if is_retryable_error(e):
+            toptex_breaker.record_failure()
+        logger.error("✗ Erreur TopTex en streaming sur %s: %s", path, e)
+        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    except BaseException:
+        toptex_sema.release()
+        raise
+    if response.status_code >= 400:
+        await response.aclose()
+        toptex_sema.release()
+        if response.status_code >= 500:
+            toptex_breaker.record_failure()
+        raise HTTPException(status_code=503, detail=f"TopTex API error: HTTP {response.status_code}")
+    toptex_breaker.record_success()
+
+    async def relay():
+        try:
+            async for chunk in response.aiter_raw():
+                yield chunk
+        finally:
+            await response.aclose()
+            toptex_sema.release()
+
+    return StreamingResponse(
+        relay(),
+        status_code=response.status_code,
+        media_type=response.headers.get("Content-Type", "application/json"),
+    )
+
+class ResponseCache:
+    """Cache TTL en mémoire pour les réponses GET, avec stale-while-revalidate.
+
+    Une entrée plus vieille que `ttl` mais plus jeune que `stale_ttl` est
+    servie immédiatement pendant qu'un rafraîchissement part en tâche de fond,
+    donc les lectures répétées d'Odoo n'attendent jamais TopTex.
+    """
+    def __init__(self, ttl=30, stale_ttl=120):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries = {}
+        self._refreshing = set()
+
+    def get(self, key):
+        """Retourne (valeur, etag, fraîche) ou (None, None, False) si absente ou trop vieille"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None, None, False
+        value, etag, stored_at = entry
+        age = time.monotonic() - stored_at
+        if age >= self.stale_ttl:
+            del self._entries[key]
+            return None, None, False
+        return value, etag, age < self.ttl
+
+    def put(self, key, value, etag=None):
+        """Stocke une valeur (et son ETag upstream) avec l'horodatage courant"""
+        self._entries[key] = (value, etag, time.monotonic())
+
+    def touch(self, key):
+        """Repart le TTL d'une entrée revalidée par un 304 Not Modified"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries[key] = (entry[0], entry[1], time.monotonic())
+
+    def invalidate(self, path):
+        """Supprime toutes les entrées associées à un chemin"""
+        for key in [k for k in self._entries if k[0] == path]:
+            del self._entries[key]
+
+    async def refresh(self, key, fetch):
+        """Rafraîchit une entrée périmée en arrière-plan (une seule tâche par clé)"""
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        try:
+            await fetch()
+        except Exception as e:
+            logger.warning("⚠ Rafraîchissement du cache échoué pour %s: %s", key, e)
+        finally:
+            self._refreshing.discard(key)
+
+# Cache des lectures produits (TTL court : le catalogue bouge peu en 30s)
+PRODUCTS_CACHE_TTL = 30
+products_cache = ResponseCache(ttl=PRODUCTS_CACHE_TTL)
+
+# Requêtes GET identiques en vol, partagées entre appelants concurrents
+_inflight = {}
+
+async def single_flight(key, fetch):
+    """Déduplique les lectures identiques simultanées : un seul appel part vers
+    TopTex, tous les appelants attendent le même résultat."""
+    existing = _inflight.get(key)
+    if existing is not None:
+        return await existing
+    task = asyncio.create_task(fetch())
+    _inflight[key] = task
+    try:
+        return await task
+    finally:
+        _inflight.pop(key, None)
+
+# Taille maximale d'un lot sur les endpoints :batchGet
+BATCH_MAX_ITEMS = 100
+
+def batch_entry(result) -> dict:
+    """Convertit un résultat d'asyncio.gather en entrée de réponse batch"""
+    if isinstance(result, HTTPException):
+        return {"error": result.detail, "status_code": result.status_code}
+    if isinstance(result, Exception):
+        return {"error": str(result)}
+    return orjson.loads(result.content)
+
+def retry_with_backoff(max_retries=3, backoff_factor=1, max_wait=30):
+    """Décorateur pour réessayer les requêtes avec backoff exponentiel et full jitter"""
     def decorator(func):
         @wraps(func)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             for attempt in range(max_retries):
                 try:
-                    return func(*args, **kwargs)
-                except requests.exceptions.RequestException as e:
+                    return await func(*args, **kwargs)
+                except RateLimited as e:
                     if attempt == max_retries - 1:
+                        raise HTTPException(status_code=429, detail="TopTex rate limit exceeded")
+                    # Le serveur sait mieux que nous : on respecte son Retry-After
+                    wait_time = min(e.retry_after, max_wait) + random.uniform(0, 0.5)
+                    logger.warning("Tentative %s: limité par TopTex. Attente %.2fs (Retry-After)", attempt + 1, wait_time)
+                    await asyncio.sleep(wait_time)
+                except httpx.HTTPError as e:
+                    if attempt == max_retries - 1 or not is_retryable_error(e):
                         raise
-                    wait_time = backoff_factor * (2 ** attempt)
-                    logger.warning(f"Tentative {attempt + 1} échouée. Attente {wait_time}s avant nouvelle tentative")
-                    time.sleep(wait_time)
+                    # Full jitter (AWS) : évite que les clients concurrents réessaient en phase
+                    wait_time = min(random.uniform(0, backoff_factor * (2 ** attempt)), max_wait)
+                    logger.warning("Tentative %s échouée. Attente %.2fs avant nouvelle tentative", attempt + 1, wait_time)
+                    await asyncio.sleep(wait_time)
         return wrapper
     return decorator
 
-def get_toptex_headers():
-    """Retourne les headers nécessaires pour les requêtes TopTex avec token d'authentification"""
-    token = auth_manager.get_token()
-    return {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
-    }
+async def get_toptex_headers():
+    """Retourne les headers TopTex pré-construits, après rafraîchissement du token si besoin"""
+    await auth_manager.get_token()
+    return auth_manager._headers
 
 def verify_webhook_secret(req: Request):
     """Vérifie le secret du webhook"""
@@ -131,102 +512,149 @@ def verify_webhook_secret(req: Request):
         if req.headers.get("x-odoo-signature") != WEBHOOK_SECRET:
             raise HTTPException(status_code=401, detail="Unauthorized")
 
+@app.exception_handler(httpx.HTTPError)
+async def toptex_error_handler(request: Request, exc: httpx.HTTPError):
+    """Convertit toute erreur TopTex non rattrapée en 503 (log et format uniques)"""
+    logger.error("✗ Erreur TopTex sur %s %s: %s", request.method, request.url.path, exc)
+    return ORJSONResponse(status_code=503, content={"detail": f"TopTex API error: {str(exc)}"})
+
+@app.exception_handler(RateLimited)
+async def rate_limited_handler(request: Request, exc: RateLimited):
+    """Répond 429 si la limitation TopTex persiste après les tentatives"""
+    return ORJSONResponse(status_code=429, content={"detail": "TopTex rate limit exceeded"})
+
 # =============================================================================
 # PRODUITS - Endpoints
 # =============================================================================
 
 @app.get("/products")
 @retry_with_backoff()
-async def get_products(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
-    """Récupère la liste de tous les produits TopTex"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/products",
-            headers=headers,
+async def get_products(response: Response, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    """Récupère la liste de tous les produits TopTex (avec cache court)"""
+    # Les grandes pages sont relayées telles quelles, sans décodage ni cache
+    if limit > STREAM_PAGE_THRESHOLD:
+        return await stream_toptex("GET", "/products", params={"skip": skip, "limit": limit})
+
+    cache_key = ("/products", skip, limit)
+
+    async def fetch():
+        cached_value, cached_etag, _ = products_cache.get(cache_key)
+        upstream = await call_toptex(
+            "GET",
+            "/products",
             params={"skip": skip, "limit": limit},
-            timeout=30
+            headers={"If-None-Match": cached_etag} if cached_etag else None,
         )
-        response.raise_for_status()
-        logger.info(f"✓ Produits récupérés avec succès (skip={skip}, limit={limit})")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération des produits: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+        if upstream.status_code == 304 and cached_value is not None:
+            products_cache.touch(cache_key)
+            return cached_value, cached_etag
+        data = orjson.loads(upstream.content)
+        etag = upstream.headers.get("ETag")
+        products_cache.put(cache_key, data, etag)
+        return data, etag
+
+    response.headers["Cache-Control"] = f"max-age={PRODUCTS_CACHE_TTL}"
+    cached, etag, fresh = products_cache.get(cache_key)
+    if cached is not None:
+        if not fresh:
+            asyncio.create_task(products_cache.refresh(cache_key, fetch))
+        if etag:
+            response.headers["ETag"] = etag
+        logger.debug("✓ Produits servis depuis le cache (skip=%s, limit=%s)", skip, limit)
+        return cached
+    data, etag = await fetch()
+    if etag:
+        response.headers["ETag"] = etag
+    logger.debug("✓ Produits récupérés avec succès (skip=%s, limit=%s)", skip, limit)
+    return data
 
 @app.get("/products/{sku}")
 @retry_with_backoff()
-async def get_product(sku: str):
-    """Récupère les détails d'un produit spécifique"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/products/{sku}",
-            headers=headers,
-            timeout=30
+async def get_product(sku: str, response: Response):
+    """Récupère les détails d'un produit spécifique (avec cache court)"""
+    cache_key = ("/products/" + sku,)
+
+    async def fetch():
+        cached_value, cached_etag, _ = products_cache.get(cache_key)
+        upstream = await call_toptex(
+            "GET",
+            "/products/" + sku,
+            headers={"If-None-Match": cached_etag} if cached_etag else None,
         )
-        response.raise_for_status()
-        logger.info(f"✓ Produit {sku} récupéré")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération du produit {sku}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+        if upstream.status_code == 304 and cached_value is not None:
+            products_cache.touch(cache_key)
+            return cached_value, cached_etag
+        data = orjson.loads(upstream.content)
+        etag = upstream.headers.get("ETag")
+        products_cache.put(cache_key, data, etag)
+        return data, etag
+
+    response.headers["Cache-Control"] = f"max-age={PRODUCTS_CACHE_TTL}"
+    cached, etag, fresh = products_cache.get(cache_key)
+    if cached is not None:
+        if not fresh:
+            asyncio.create_task(products_cache.refresh(cache_key, fetch))
+        if etag:
+            response.headers["ETag"] = etag
+        logger.debug("✓ Produit %s servi depuis le cache", sku)
+        return cached
+    data, etag = await single_flight(cache_key, fetch)
+    if etag:
+        response.headers["ETag"] = etag
+    logger.debug("✓ Produit %s récupéré", sku)
+    return data
 
 @app.post("/products")
 @retry_with_backoff()
 async def create_product(product: Product):
     """Crée un nouveau produit dans TopTex"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.post(
-            f"{TOPTEX_BASE_URL}/products",
-            headers=headers,
-            json=product.dict(),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Produit {product.sku} créé")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la création du produit: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "POST",
+        "/products",
+        content=orjson.dumps(product.model_dump(mode="json")),
+    )
+    products_cache.invalidate("/products")
+    logger.debug("✓ Produit %s créé", product.sku)
+    return orjson.loads(response.content)
 
 @app.put("/products/{sku}")
 @retry_with_backoff()
 async def update_product(sku: str, product: Product):
     """Met à jour un produit existant"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.put(
-            f"{TOPTEX_BASE_URL}/products/{sku}",
-            headers=headers,
-            json=product.dict(),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Produit {sku} mis à jour")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la mise à jour du produit {sku}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "PUT",
+        "/products/" + sku,
+        content=orjson.dumps(product.model_dump(mode="json")),
+    )
+    products_cache.invalidate("/products")
+    products_cache.invalidate("/products/" + sku)
+    logger.debug("✓ Produit %s mis à jour", sku)
+    return orjson.loads(response.content)
 
 @app.delete("/products/{sku}")
 @retry_with_backoff()
 async def delete_product(sku: str):
     """Supprime un produit"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.delete(
-            f"{TOPTEX_BASE_URL}/products/{sku}",
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Produit {sku} supprimé")
-        return {"message": "Product deleted successfully"}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la suppression du produit {sku}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "DELETE",
+        "/products/" + sku,
+    )
+    products_cache.invalidate("/products")
+    products_cache.invalidate("/products/" + sku)
+    logger.debug("✓ Produit %s supprimé", sku)
+    return {"message": "Product deleted successfully"}
+
+@app.post("/products:batchGet")
+async def batch_get_products(skus: List[str]):
+    """Récupère plusieurs produits en un seul appel (fan-out concurrent vers TopTex)"""
+    if len(skus) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Too many SKUs (max {BATCH_MAX_ITEMS})")
+    results = await asyncio.gather(
+        *[call_toptex("GET", "/products/" + sku) for sku in skus],
+        return_exceptions=True
+    )
+    logger.debug("✓ Batch produits: %s SKUs demandés", len(skus))
+    return {sku: batch_entry(result) for sku, result in zip(skus, results)}
 
 # =============================================================================
 # COMMANDES - Endpoints
@@ -236,97 +664,80 @@ async def delete_product(sku: str):
 @retry_with_backoff()
 async def get_orders(status: Optional[str] = None, skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
     """Récupère la liste de toutes les commandes"""
-    try:
-        headers = get_toptex_headers()
-        params = {"skip": skip, "limit": limit}
-        if status:
-            params["status"] = status
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/orders",
-            headers=headers,
-            params=params,
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Commandes récupérées (status={status}, skip={skip}, limit={limit})")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération des commandes: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    params = {"skip": skip, "limit": limit}
+    if status:
+        params["status"] = status
+    if limit > STREAM_PAGE_THRESHOLD:
+        return await stream_toptex("GET", "/orders", params=params)
+    response = await call_toptex(
+        "GET",
+        "/orders",
+        params=params,
+    )
+    logger.debug("✓ Commandes récupérées (status=%s, skip=%s, limit=%s)", status, skip, limit)
+    return orjson.loads(response.content)
 
 @app.get("/orders/{order_number}")
 @retry_with_backoff()
 async def get_order(order_number: str):
     """Récupère les détails d'une commande spécifique"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/orders/{order_number}",
-            headers=headers,
-            timeout=30
+    async def fetch():
+        upstream = await call_toptex(
+            "GET",
+            "/orders/" + order_number,
         )
-        response.raise_for_status()
-        logger.info(f"✓ Commande {order_number} récupérée")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération de la commande {order_number}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+        return orjson.loads(upstream.content)
+
+    data = await single_flight(("order", order_number), fetch)
+    logger.debug("✓ Commande %s récupérée", order_number)
+    return data
 
 @app.post("/orders")
 @retry_with_backoff()
 async def create_order(order: Order):
     """Crée une nouvelle commande dans TopTex"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.post(
-            f"{TOPTEX_BASE_URL}/orders",
-            headers=headers,
-            json=order.dict(),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Commande {order.order_number} créée")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la création de la commande: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "POST",
+        "/orders",
+        content=orjson.dumps(order.model_dump(mode="json")),
+    )
+    logger.debug("✓ Commande %s créée", order.order_number)
+    return orjson.loads(response.content)
 
 @app.put("/orders/{order_number}")
 @retry_with_backoff()
 async def update_order(order_number: str, update: UpdateOrder):
     """Met à jour le statut ou les infos de suivi d'une commande"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.put(
-            f"{TOPTEX_BASE_URL}/orders/{order_number}",
-            headers=headers,
-            json=update.dict(exclude_unset=True),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Commande {order_number} mise à jour")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la mise à jour de la commande {order_number}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "PUT",
+        "/orders/" + order_number,
+        content=orjson.dumps(update.model_dump(mode="json", exclude_unset=True)),
+    )
+    logger.debug("✓ Commande %s mise à jour", order_number)
+    return orjson.loads(response.content)
 
 @app.delete("/orders/{order_number}")
 @retry_with_backoff()
 async def delete_order(order_number: str):
     """Annule/supprime une commande"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.delete(
-            f"{TOPTEX_BASE_URL}/orders/{order_number}",
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Commande {order_number} supprimée")
-        return {"message": "Order cancelled successfully"}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la suppression de la commande {order_number}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "DELETE",
+        "/orders/" + order_number,
+    )
+    logger.debug("✓ Commande %s supprimée", order_number)
+    return {"message": "Order cancelled successfully"}
+
+@app.post("/orders:batchGet")
+async def batch_get_orders(order_numbers: List[str]):
+    """Récupère plusieurs commandes en un seul appel (fan-out concurrent vers TopTex)"""
+    if len(order_numbers) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=422, detail=f"Too many order numbers (max {BATCH_MAX_ITEMS})")
+    results = await asyncio.gather(
+        *[call_toptex("GET", "/orders/" + order_number) for order_number in order_numbers],
+        return_exceptions=True
+    )
+    logger.debug("✓ Batch commandes: %s numéros demandés", len(order_numbers))
+    return {number: batch_entry(result) for number, result in zip(order_numbers, results)}
 
 # =============================================================================
 # CLIENTS - Endpoints
@@ -336,140 +747,147 @@ async def delete_order(order_number: str):
 @retry_with_backoff()
 async def get_customers(skip: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
     """Récupère la liste de tous les clients"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/customers",
-            headers=headers,
-            params={"skip": skip, "limit": limit},
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Clients récupérés (skip={skip}, limit={limit})")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération des clients: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    if limit > STREAM_PAGE_THRESHOLD:
+        return await stream_toptex("GET", "/customers", params={"skip": skip, "limit": limit})
+    response = await call_toptex(
+        "GET",
+        "/customers",
+        params={"skip": skip, "limit": limit},
+    )
+    logger.debug("✓ Clients récupérés (skip=%s, limit=%s)", skip, limit)
+    return orjson.loads(response.content)
 
 @app.get("/customers/{customer_id}")
 @retry_with_backoff()
 async def get_customer(customer_id: str):
     """Récupère les détails d'un client spécifique"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/customers/{customer_id}",
-            headers=headers,
-            timeout=30
+    async def fetch():
+        upstream = await call_toptex(
+            "GET",
+            "/customers/" + customer_id,
         )
-        response.raise_for_status()
-        logger.info(f"✓ Client {customer_id} récupéré")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la récupération du client {customer_id}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+        return orjson.loads(upstream.content)
+
+    data = await single_flight(("customer", customer_id), fetch)
+    logger.debug("✓ Client %s récupéré", customer_id)
+    return data
 
 @app.post("/customers")
 @retry_with_backoff()
 async def create_customer(customer: Customer):
     """Crée un nouveau client dans TopTex"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.post(
-            f"{TOPTEX_BASE_URL}/customers",
-            headers=headers,
-            json=customer.dict(),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Client {customer.customer_id} créé")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la création du client: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "POST",
+        "/customers",
+        content=orjson.dumps(customer.model_dump(mode="json")),
+    )
+    logger.debug("✓ Client %s créé", customer.customer_id)
+    return orjson.loads(response.content)
 
 @app.put("/customers/{customer_id}")
 @retry_with_backoff()
 async def update_customer(customer_id: str, customer: Customer):
     """Met à jour un client existant"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.put(
-            f"{TOPTEX_BASE_URL}/customers/{customer_id}",
-            headers=headers,
-            json=customer.dict(),
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Client {customer_id} mis à jour")
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la mise à jour du client {customer_id}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "PUT",
+        "/customers/" + customer_id,
+        content=orjson.dumps(customer.model_dump(mode="json")),
+    )
+    logger.debug("✓ Client %s mis à jour", customer_id)
+    return orjson.loads(response.content)
 
 @app.delete("/customers/{customer_id}")
 @retry_with_backoff()
 async def delete_customer(customer_id: str):
     """Supprime un client"""
-    try:
-        headers = get_toptex_headers()
-        response = requests.delete(
-            f"{TOPTEX_BASE_URL}/customers/{customer_id}",
-            headers=headers,
-            timeout=30
-        )
-        response.raise_for_status()
-        logger.info(f"✓ Client {customer_id} supprimé")
-        return {"message": "Customer deleted successfully"}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"✗ Erreur lors de la suppression du client {customer_id}: {str(e)}")
-        raise HTTPException(status_code=503, detail=f"TopTex API error: {str(e)}")
+    response = await call_toptex(
+        "DELETE",
+        "/customers/" + customer_id,
+    )
+    logger.debug("✓ Client %s supprimé", customer_id)
+    return {"message": "Customer deleted successfully"}
 
 # =============================================================================
 # WEBHOOK ODOO - Endpoint
 # =============================================================================
 
-@app.post("/odoo")
+# Déduplication des webhooks re-livrés par Odoo (clé d'idempotence type:order_number)
+WEBHOOK_DEDUP_MAX = 1000
+_processed_webhooks = OrderedDict()
+
+def webhook_already_processed(key: str) -> bool:
+    """Marque la clé d'idempotence et indique si ce webhook a déjà été accepté"""
+    if key in _processed_webhooks:
+        _processed_webhooks.move_to_end(key)
+        return True
+    _processed_webhooks[key] = True
+    if len(_processed_webhooks) > WEBHOOK_DEDUP_MAX:
+        _processed_webhooks.popitem(last=False)
+    return False
+
+async def process_webhook(webhook_type: str, order_number, model, request_id: str):
+    """Exécute l'appel TopTex d'un webhook déjà validé, en tâche de fond"""
+    try:
+        if webhook_type == "order_created":
+            # Créer la commande dans TopTex
+            await create_order(model)
+        elif webhook_type == "order_updated":
+            # Mettre à jour la commande dans TopTex
+            await update_order(order_number, model)
+        logger.debug("✓ Webhook %s traité (request_id=%s)", webhook_type, request_id)
+    except Exception as e:
+        logger.error("✗ Erreur lors du traitement du webhook Odoo %s: %s", request_id, e)
+
+@app.post("/odoo", status_code=202)
 async def from_odoo(req: Request):
-    """Reçoit les webhooks d'Odoo et les traite"""
+    """Reçoit les webhooks d'Odoo, accuse réception immédiatement et traite en tâche de fond.
+
+    Répondre avant l'appel TopTex évite qu'Odoo considère le webhook en
+    timeout et le re-livre (commandes dupliquées) quand l'upstream est lent.
+    Le payload est validé ici, avant l'accusé de réception : un webhook
+    malformé reçoit un 400 et ne consomme pas sa clé d'idempotence.
+    """
     verify_webhook_secret(req)
-    
+
     try:
         payload = await req.json()
-        logger.info(f"✓ Webhook Odoo reçu: {payload.get('type', 'unknown')}")
-        
-        # Traitement selon le type de webhook
-        webhook_type = payload.get("type")
-        
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Error processing webhook: {str(e)}")
+
+    webhook_type = payload.get("type")
+    logger.debug("✓ Webhook Odoo reçu: %s", webhook_type or "unknown")
+
+    if webhook_type not in ("order_created", "order_updated"):
+        logger.warning("Type de webhook inconnu: %s", webhook_type)
+        return {"status": "unknown_type", "webhook_type": webhook_type}
+
+    try:
         if webhook_type == "order_created":
-            # Créer la commande dans TopTex
-            order = Order(
+            model = Order(
                 order_number=payload.get("order_number"),
                 customer_id=payload.get("customer_id"),
                 items=payload.get("items", []),
                 total_price=payload.get("total_price", 0),
                 shipping_address=payload.get("shipping_address")
             )
-            result = await create_order(order)
-            return {"status": "processed", "result": result}
-        
-        elif webhook_type == "order_updated":
-            # Mettre à jour la commande dans TopTex
-            update = UpdateOrder(
+        else:
+            model = UpdateOrder(
                 status=payload.get("status"),
                 tracking_number=payload.get("tracking_number")
             )
-            result = await update_order(payload.get("order_number"), update)
-            return {"status": "processed", "result": result}
-        
-        else:
-            logger.warning(f"Type de webhook inconnu: {webhook_type}")
-            return {"status": "unknown_type", "webhook_type": webhook_type}
-            
-    except Exception as e:
-        logger.error(f"✗ Erreur lors du traitement du webhook Odoo: {str(e)}")
+    except ValidationError as e:
+        logger.warning("Webhook %s invalide: %s", webhook_type, e)
         raise HTTPException(status_code=400, detail=f"Error processing webhook: {str(e)}")
 
+    idempotency_key = f"{webhook_type}:{payload.get('order_number')}"
+    if webhook_already_processed(idempotency_key):
+        logger.debug("Webhook déjà traité, re-livraison ignorée: %s", idempotency_key)
+        return {"status": "duplicate", "idempotency_key": idempotency_key}
+
+    request_id = str(uuid.uuid4())
+    asyncio.create_task(process_webhook(webhook_type, payload.get("order_number"), model, request_id))
+    return {"status": "accepted", "request_id": request_id}
+
 # =============================================================================
 # AUTHENTICATION - Endpoint
 # =============================================================================
@@ -478,14 +896,14 @@ async def from_odoo(req: Request):
 async def auth_status():
     """Vérifie l'état de l'authentification TopTex"""
     try:
-        token = auth_manager.get_token()
+        token = await auth_manager.get_token()
         return {
             "status": "authenticated",
             "token_valid": auth_manager.is_token_valid(),
             "token_expiry": auth_manager.token_expiry.isoformat() if auth_manager.token_expiry else None
         }
     except Exception as e:
-        logger.error(f"✗ Erreur d'authentification: {str(e)}")
+        logger.error("✗ Erreur d'authentification: %s", e)
         raise HTTPException(status_code=503, detail=f"Authentication error: {str(e)}")
 
 # =============================================================================
@@ -496,20 +914,30 @@ async def auth_status():
 async def health_check():
     """Vérifie l'état de l'API"""
     try:
-        headers = get_toptex_headers()
-        response = requests.get(
-            f"{TOPTEX_BASE_URL}/health",
-            headers=headers,
+        response = await call_toptex(
+            "GET",
+            "/health",
             timeout=10
         )
         return {
             "status": "healthy",
-            "toptex_api": "connected" if response.status_code == 200 else "disconnected"
+            "toptex_api": "connected" if response.status_code == 200 else "disconnected",
+            "http_version": response.http_version,
+            "circuit_breaker": toptex_breaker.state,
+            "bulkhead_free_slots": toptex_sema._value,
+            "bulkhead_queue_depth": toptex_queue_depth,
+            "rate_limiter_tokens": round(toptex_bucket.level, 1),
+            "connection_pool": pool_stats()
         }
     except:
         return {
             "status": "degraded",
-            "toptex_api": "disconnected"
+            "toptex_api": "disconnected",
+            "circuit_breaker": toptex_breaker.state,
+            "bulkhead_free_slots": toptex_sema._value,
+            "bulkhead_queue_depth": toptex_queue_depth,
+            "rate_limiter_tokens": round(toptex_bucket.level, 1),
+            "connection_pool": pool_stats()
         }
 
 @app.get("/")
@@ -535,10 +963,18 @@ async def root():
 
 @app.on_event("startup")
 async def startup_event():
-    """S'authentifie automatiquement auprès de TopTex au démarrage"""
+    """Crée le client HTTP partagé et s'authentifie auprès de TopTex au démarrage"""
+    app.state.http = create_http_client()
     try:
-        token = auth_manager.get_token()
+        token = await auth_manager.get_token()
         logger.info("✓ API démarrée et authentifiée auprès de TopTex")
     except Exception as e:
-        logger.warning(f"⚠ Attention: Impossible de s'authentifier au démarrage: {str(e)}")
+        logger.warning("⚠ Attention: Impossible de s'authentifier au démarrage: %s", e)
         logger.info("  L'authentification sera tentée lors du premier appel API")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Ferme proprement le client HTTP partagé"""
+    client = getattr(app.state, "http", None)
+    if client is not None:
+        await client.aclose()